@@ -12,6 +12,19 @@ from fastapi import Request
 from fastapi.responses import StreamingResponse
 from typing import Dict
 
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+
 from config.base import (
     MODAL_CPU,
     MODAL_MEMORY,
@@ -21,11 +34,17 @@ from config.base import (
     PPLX_MODEL,
     PPLX_MODEL_TEMPERATURE,
     WEATHER_API_URL,
+    WEATHER_CACHE_TTL_SECONDS,
+    WEATHER_API_TIMEOUT_SECONDS,
+    TRACE_SAMPLE_RATE,
+    SEMANTIC_CACHE_MAX_SIZE,
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
 )
 
 from config.prompts import (
     SOURCE_QA_PROMPT_SYSTEM,
     SOURCE_QA_PROMPT_USER,
+    SUB_QUESTION_PROMPT_TMPL,
     SYSTEM_PROMPT,
     SYSTEM_PROMPT_ENTIRE_CHAT,
 )
@@ -56,13 +75,158 @@ moonsync_image = Image.debian_slim(python_version="3.10").pip_install(
     "llama-index-multi-modal-llms-azure-openai",
     "langfuse",
     "llama-index-llms-groq",
-    "llama-index-embeddings-azure-openai"
+    "llama-index-embeddings-azure-openai",
+    "httpx[http2]~=0.27.0"
 )
 
 moonsync_volume = Volume.from_name("moonsync")
 
 app = App("moonsync-modal-app")
 
+# Greetings/acks that don't need the sub-question pipeline at all
+_TRIVIAL_RE = re.compile(r"^(hi|hello|hey|thanks|thank you|ok|okay|bye)[.! ]*$")
+_TRIVIAL_RESPONSE = "Hi! How are you feeling today? 💜"
+
+
+class SemanticCache:
+    """Two-tier cache for streamed chat responses.
+
+    Tier 1 is an exact lookup on a sha256 of the normalized prompt + phase +
+    date. Tier 2 embeds the prompt and matches against the stored embedding
+    matrix by cosine similarity, so near-duplicate questions ("what should I
+    eat in follicular phase?") reuse the already generated answer instead of
+    re-running the whole sub-question pipeline.
+    """
+
+    def __init__(self, embed_model, max_size=SEMANTIC_CACHE_MAX_SIZE,
+                 similarity_threshold=SEMANTIC_CACHE_SIMILARITY_THRESHOLD):
+        self.embed_model = embed_model
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        # key -> list of streamed tokens, LRU ordered (oldest first)
+        self._entries = OrderedDict()
+        # Embeddings live in one contiguous int8 matrix (plus a float32
+        # scale per row), maintained on insert/evict so lookups scan it
+        # as-is. Symmetric per-vector int8 quantization keeps the scan 4x
+        # smaller (and less memory-bandwidth bound) than float32, at a
+        # precision cost far below the 0.95 match threshold.
+        self._keys = []
+        self._matrix = None
+        self._scales = None
+        # (phase, date) the cached answers were generated under
+        self._context = None
+
+    def set_context(self, phase, date):
+        """Flush the cache when the phase or day rolls over.
+
+        Cached answers bake in the phase and "Today's date" from the prompt
+        context, and the semantic tier matches on prompt embedding alone -
+        without this, a warm container would serve last phase's (or
+        yesterday's) advice for a near-duplicate question.
+        """
+        context = (phase, str(date))
+        if context != self._context:
+            self._context = context
+            self._entries.clear()
+            self._keys = []
+            self._matrix = None
+            self._scales = None
+
+    @staticmethod
+    def make_key(prompt, phase, date):
+        normalized = " ".join(prompt.lower().split())
+        return hashlib.sha256(f"{normalized}|{phase}|{date}".encode()).hexdigest()
+
+    def embed(self, prompt):
+        import numpy as np
+
+        vector = np.asarray(
+            self.embed_model.get_text_embedding(prompt), dtype=np.float32
+        )
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def get_exact(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        return None
+
+    @staticmethod
+    def _quantize(vector):
+        import numpy as np
+
+        scale = float(np.abs(vector).max()) / 127.0
+        if scale == 0.0:
+            scale = 1.0
+        quantized = np.round(vector / scale).astype(np.int8)
+        return quantized, scale
+
+    def get_similar(self, query_embedding):
+        import numpy as np
+
+        if not self._keys:
+            return None
+        query_q, query_scale = self._quantize(query_embedding)
+        # int32-accumulated GEMV straight over the stored int8 matrix -
+        # only the query is quantized per lookup, the matrix is never
+        # copied or widened
+        sims = np.matmul(self._matrix, query_q, dtype=np.int32) * (
+            self._scales * query_scale
+        )
+        best = int(np.argmax(sims))
+        if sims[best] > self.similarity_threshold:
+            print(f"Semantic cache hit (similarity={sims[best]:.3f})")
+            best_key = self._keys[best]
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key]
+        return None
+
+    def put(self, key, query_embedding, tokens):
+        import numpy as np
+
+        self._entries[key] = tokens
+        self._entries.move_to_end(key)
+        quantized, scale = self._quantize(query_embedding)
+        if key in self._keys:
+            row = self._keys.index(key)
+            self._matrix[row] = quantized
+            self._scales[row] = scale
+        elif self._matrix is None:
+            self._keys.append(key)
+            self._matrix = quantized[None, :].copy()
+            self._scales = np.array([scale], dtype=np.float32)
+        else:
+            self._keys.append(key)
+            self._matrix = np.ascontiguousarray(
+                np.vstack([self._matrix, quantized[None, :]])
+            )
+            self._scales = np.append(self._scales, np.float32(scale))
+        while len(self._entries) > self.max_size:
+            old_key, _ = self._entries.popitem(last=False)
+            self._evict(old_key)
+
+    def _evict(self, key):
+        import numpy as np
+
+        if key not in self._keys:
+            return
+        row = self._keys.index(key)
+        self._keys.pop(row)
+        if not self._keys:
+            self._matrix = None
+            self._scales = None
+        else:
+            self._matrix = np.ascontiguousarray(np.delete(self._matrix, row, axis=0))
+            self._scales = np.delete(self._scales, row)
+
+    async def stream(self, tokens):
+        for token in tokens:
+            await asyncio.sleep(0)
+            yield token
+
 
 @app.cls(
     cpu=MODAL_CPU,
@@ -76,13 +240,24 @@ app = App("moonsync-modal-app")
 class Model:
     @build()
     def build(self):
-        pass
+        # Bake one-time costs into the image instead of paying them on the
+        # first request after a cold start: importing the heavy libraries
+        # forces .pyc compilation, loading cl100k_base materializes
+        # tiktoken's BPE cache, and touching the SubQuestionList schema runs
+        # pydantic's model/JSON-schema compilation.
+        import llama_index.core  # noqa: F401
+        import pandas  # noqa: F401
+        import pinecone  # noqa: F401
+        import tiktoken
+        from llama_index.core.question_gen.types import SubQuestionList
+
+        tiktoken.get_encoding("cl100k_base").encode(SYSTEM_PROMPT)
+        SubQuestionList.schema()
 
     @enter()
     def enter(self):
         from pinecone import Pinecone
-        import os
-        import shutil
+        from concurrent.futures import ThreadPoolExecutor
         from llama_index.core import Settings
         from llama_index.llms.openai import OpenAI
         from llama_index.core import VectorStoreIndex
@@ -130,7 +305,7 @@ class Model:
         # self.small_llm = OpenAI(model="gpt-3.5-turbo", temperature=0.1)
         # llama3-70b-8192
         self.groq = Groq(model="llama3-8b-8192", api_key=os.environ["GROQ_API_KEY"], temperature=0.1)
-        # self.groq_70b = Groq(model="llama3-70b-8192", api_key=os.environ["GROQ_API_KEY"], temperature=0.1)
+        self.groq_70b = Groq(model="llama3-70b-8192", api_key=os.environ["GROQ_API_KEY"], temperature=0.1)
         self.llm = OpenAI(model="gpt-4-turbo", temperature=0.1)
         self.subquestion_llm = OpenAILike(model="llama3-8b-8192", 
                                   api_base="https://api.groq.com/openai/v1", 
@@ -140,7 +315,24 @@ class Model:
                                   is_chat_model=True
                                 )
         
-        self.embed_model = AzureOpenAIEmbedding(
+        # Embeddings for generated sub-questions are prefetched in one
+        # batched request (see CustomOpenAIQuestionGenerator below); this
+        # wrapper serves them from the cache so retrieval skips the
+        # per-sub-question embedding round-trip.
+        subq_embed_cache = {}
+
+        class CachingAzureOpenAIEmbedding(AzureOpenAIEmbedding):
+            def _get_query_embedding(self, query):
+                if query in subq_embed_cache:
+                    return subq_embed_cache[query]
+                return super()._get_query_embedding(query)
+
+            async def _aget_query_embedding(self, query):
+                if query in subq_embed_cache:
+                    return subq_embed_cache[query]
+                return await super()._aget_query_embedding(query)
+
+        self.embed_model = CachingAzureOpenAIEmbedding(
             model="text-embedding-ada-002",
             deployment_name="embedding-model",
             api_key=self.api_key,
@@ -148,7 +340,51 @@ class Model:
             api_version="2023-10-01-preview",
         )
  
-        langfuse_callback_handler = LlamaIndexCallbackHandler()
+        # Tracing every LLM call / retrieval / sub-question step pays event
+        # construction + serialization on the hot path; sample a fraction of
+        # traces instead. The decision is made once per trace so sampled
+        # requests are still traced end to end.
+        # The sampling decision is thread-local: traces from concurrent
+        # threads (the dashboard warm-up thread vs live request handlers)
+        # each keep their own flag, so one thread rolling an unsampled
+        # trace can't cut off another thread's in-flight sampled trace.
+        class SamplingLlamaIndexCallbackHandler(LlamaIndexCallbackHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self._sampling = threading.local()
+
+            def _is_sampled(self):
+                return getattr(self._sampling, "sampled", False)
+
+            def start_trace(self, trace_id=None):
+                self._sampling.sampled = random.random() < TRACE_SAMPLE_RATE
+                if self._sampling.sampled:
+                    super().start_trace(trace_id)
+
+            def end_trace(self, trace_id=None, trace_map=None):
+                # Deliberately no reset here: on a streamed request the
+                # synthesis LLM's on_event_end only fires once the token
+                # generator is exhausted - on the same per-request pump
+                # thread, after end_trace - so clearing the flag would
+                # drop the final LLM span of every sampled stream. The
+                # next start_trace on the thread overwrites the flag.
+                if self._is_sampled():
+                    super().end_trace(trace_id, trace_map)
+
+            def on_event_start(
+                self, event_type, payload=None, event_id="", parent_id="", **kwargs
+            ):
+                if self._is_sampled():
+                    return super().on_event_start(
+                        event_type, payload, event_id, parent_id, **kwargs
+                    )
+                return event_id
+
+            def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+                if self._is_sampled():
+                    super().on_event_end(event_type, payload, event_id, **kwargs)
+
+        langfuse_callback_handler = SamplingLlamaIndexCallbackHandler()
         Settings.callback_manager = CallbackManager([langfuse_callback_handler])
         
         # Init Pinecone
@@ -165,30 +401,6 @@ class Model:
 
         Settings.llm = self.llm
         Settings.embed_model = self.embed_model
-        # Pincone Indexes
-        mood_feeling_index = pc.Index("moonsync-index-mood-feeling")
-        general_index = pc.Index("moonsync-index-general")
-        diet_nutrition_index = pc.Index("moonsync-index-diet-nutrition")
-        fitness_wellness_index = pc.Index("moonsync-index-fitness-wellness")
-        indexes = [
-            mood_feeling_index,
-            general_index,
-            diet_nutrition_index,
-            fitness_wellness_index,
-        ]
-
-        print("mood_feeling_index", mood_feeling_index.describe_index_stats())
-        print("general_index", general_index.describe_index_stats())
-        print("diet_nutrition", diet_nutrition_index.describe_index_stats())
-        print("fitness_wellness", fitness_wellness_index.describe_index_stats())
-
-        vector_indexes = []
-        for index in indexes:
-            vector_indexes.append(
-                VectorStoreIndex.from_vector_store(
-                    PineconeVectorStore(pinecone_index=index)
-                )
-            )
 
         # Update prompt to include sources
         sources_qa_prompt = [
@@ -203,23 +415,42 @@ class Model:
         ]
         sources_prompt = ChatPromptTemplate(sources_qa_prompt)
 
-        # Create Query Engines
-        query_engines = []
-        dashboard_data_query_engines = []
-        for vector_index in vector_indexes:
-            query_engines.append(
-                vector_index.as_query_engine(
-                    llm=self.groq,
-                    similarity_top_k=2,
-                    text_qa_template=sources_prompt,
-                    # refine_template=refine_template
+        # All topics live in the combined Pinecone index under one namespace
+        # per topic (see migrate_to_namespaces.py), so every query reuses a
+        # single index handle / HTTPS connection instead of four endpoints.
+        pinecone_index = pc.Index("moonsync-index")
+        print("moonsync-index", pinecone_index.describe_index_stats())
+        namespaces = [
+            "mood-feeling",
+            "general",
+            "diet-nutrition",
+            "fitness-wellness",
+        ]
+
+        # Build the per-topic engines concurrently; executor.map keeps the
+        # result order deterministic.
+        def build_query_engines(namespace):
+            vector_index = VectorStoreIndex.from_vector_store(
+                PineconeVectorStore(
+                    pinecone_index=pinecone_index, namespace=namespace
                 )
             )
-            dashboard_data_query_engines.append(
-                vector_index.as_query_engine(
-                    similarity_top_k=2,
-                )
+            query_engine = vector_index.as_query_engine(
+                llm=self.groq,
+                similarity_top_k=2,
+                text_qa_template=sources_prompt,
+                # refine_template=refine_template
+            )
+            dashboard_query_engine = vector_index.as_query_engine(
+                similarity_top_k=2,
             )
+            return query_engine, dashboard_query_engine
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            engine_groups = list(executor.map(build_query_engines, namespaces))
+
+        query_engines = [group[0] for group in engine_groups]
+        dashboard_data_query_engines = [group[1] for group in engine_groups]
 
         (
             mood_feeling_query_engine,
@@ -248,6 +479,18 @@ class Model:
         )
         print(self.df.head())
 
+        # Snapshot the scalars the hot endpoints need from the latest row -
+        # df.iloc[-1][...] per request pays pandas indexing overhead for what
+        # is effectively a constant until new biometric data lands.
+        latest_row = self.df.iloc[-1]
+        self._latest_biometrics = {
+            "menstrual_phase": latest_row["menstrual_phase"],
+            # seconds are integral; int keeps the "X hours Y mins" string
+            # free of trailing .0s after divmod
+            "duration_in_bed": int(latest_row["duration_in_bed"]),
+            "temperature_delta": float(latest_row["temperature_delta"]),
+        }
+
         # Pandas Query Engine
         # TODO update the date
         DEFAULT_PANDAS_TMPL = (
@@ -274,31 +517,42 @@ class Model:
             df=self.df, verbose=True, pandas_prompt=DEFAULT_PANDAS_PROMPT, llm=self.llm
         )
 
-        # setup token.json for gcal
+        # setup token.json for gcal - symlink into the working dir instead of
+        # copying so repeated container starts never re-read the file from the
+        # mounted volume (and the credential stays in place on the volume)
         token_json = "/volumes/moonsync/google_credentials/token.json"
         destination_path = "token.json"
-        shutil.move(token_json, destination_path)
+        try:
+            os.symlink(token_json, destination_path)
+        except FileExistsError:
+            pass
 
         self.SYSTEM_PROMPT = SYSTEM_PROMPT
 
-        # Text QA Prompt
-        # Get the current date
-        self.current_date = datetime.strptime(datetime.today().strftime('%Y-%m-%d'), '%Y-%m-%d').date()
+        # Build the system message once per container and share it by
+        # reference - it never changes, so there is no reason to reallocate
+        # it on every request. The token count of the static prompt is also
+        # pre-encoded so downstream token budgeting can skip a count pass.
+        self._system_message = ChatMessage(
+            role=MessageRole.SYSTEM, content=self.SYSTEM_PROMPT
+        )
+
+        import tiktoken
+
+        self.system_prompt_token_count = len(
+            tiktoken.get_encoding("cl100k_base").encode(self.SYSTEM_PROMPT)
+        )
+        print("System prompt tokens: ", self.system_prompt_token_count)
+
+        # Date context is derived lazily (see the current_date /
+        # content_template properties) so a warm container doesn't keep
+        # reporting the date it booted on.
+        self._cached_date = None
+        self._cached_content = None
+        self._static_chat_history = None
         timestamp = datetime.fromisoformat(str(self.df.iloc[-1]["date"]))
         print("Current date: ", self.current_date)
-        day_of_week = self.current_date.weekday()
-        day_names = [
-            "Monday",
-            "Tuesday",
-            "Wednesday",
-            "Thursday",
-            "Friday",
-            "Saturday",
-            "Sunday",
-        ]
-        self.day_name = day_names[day_of_week]
-        self.content_template = f"\nImportant information to be considered while answering the query:\nCurrent Mensural Phase: {self.df.iloc[-1]['menstrual_phase']} \nToday's date: {self.current_date} \nDay of the week: {self.day_name} \n Current Location: New York City"
-        self.phase_info = f"My current mensural phase is: {self.df.iloc[-1]['menstrual_phase']}"
+        self.phase_info = f"My current mensural phase is: {self._latest_biometrics['menstrual_phase']}"
 
         chat_text_qa_msgs = [
             ChatMessage(
@@ -356,6 +610,17 @@ class Model:
             streaming=True,
         )
 
+        # Groq's llama3-70b streams tokens far faster (and cheaper) than
+        # gpt-4-turbo; standard queries are synthesized there and only
+        # complex fan-outs escalate (see CustomSubQuestionQueryEngine).
+        fast_response_synthesizer = get_response_synthesizer(
+            llm=self.groq_70b,
+            text_qa_template=text_qa_template,
+            refine_template=refine_template,
+            use_async=False,
+            streaming=True,
+        )
+
         """### Create tools for each category"""
         mood_feeling_tool = QueryEngineTool(
             query_engine=mood_feeling_query_engine,
@@ -411,33 +676,6 @@ class Model:
             ),
         )
 
-        SUB_QUESTION_PROMPT_TMPL = """\
-        You are a world class state of the art agent who specializes in women's menstrual health and related topics.
-
-        You have access to multiple tools, each representing a different data source or API.
-        Each of the tools has a name and a description, formatted as a JSON dictionary.
-        The keys of the dictionary are the names of the tools and the values are the \
-        descriptions.
-        Your purpose is to help answer a complex user question by generating a list of sub \
-        questions that can be answered by the tools.
-
-        These are the guidelines you consider when completing your task:
-        * Be as specific as possible
-        * The sub questions should be relevant to the user question
-        * The sub questions should be answerable by the tools provided
-        * You can generate multiple sub questions for each tool
-        * Tools must be specified by their name, not their description
-                
-        Only Output the list of sub questions by calling the SubQuestionList function, nothing else.
-
-        ## Tools
-        ```json
-        {tools_str}
-        ```
-
-        ## User Question
-        {query_str}
-        """
         from llama_index.core.question_gen.prompts import build_tools_text
         from typing import List, Optional, Sequence, cast
         from llama_index.core.llms.llm import LLM
@@ -451,12 +689,27 @@ class Model:
         from llama_index.core.tools.types import ToolMetadata
         
         class CustomOpenAIQuestionGenerator(OpenAIQuestionGenerator):
+            def _prefetch_embeddings(self, sub_questions, vectors=None):
+                # One batched embedding request for all sub-questions instead
+                # of one HTTP call each at retrieval time.
+                texts = [item.sub_question for item in sub_questions]
+                try:
+                    if vectors is None:
+                        vectors = Settings.embed_model.get_text_embedding_batch(
+                            texts, show_progress=False
+                        )
+                    subq_embed_cache.clear()
+                    subq_embed_cache.update(dict(zip(texts, vectors)))
+                except Exception as e:
+                    print("Failed to prefetch sub-question embeddings", e)
+
             def generate(self, tools: Sequence[ToolMetadata], query: QueryBundle) -> List[SubQuestion]:
                 tools_str = build_tools_text(tools)
                 query_str = query.query_str
                 question_list = cast(
                     SubQuestionList, self._program(query_str=query_str.split("<Follow Up Message>")[1], tools_str=tools_str)
                 )
+                self._prefetch_embeddings(question_list.items)
                 return question_list.items
 
             async def agenerate(
@@ -469,13 +722,94 @@ class Model:
                     await self._program.acall(query_str=query_str.split("<Follow Up Message>")[1], tools_str=tools_str),
                 )
                 assert isinstance(question_list, SubQuestionList)
+                texts = [item.sub_question for item in question_list.items]
+                try:
+                    vectors = await Settings.embed_model.aget_text_embedding_batch(
+                        texts, show_progress=False
+                    )
+                except Exception:
+                    vectors = None
+                self._prefetch_embeddings(question_list.items, vectors=vectors)
                 return question_list.items
-            
+
         question_gen = CustomOpenAIQuestionGenerator.from_defaults(
             prompt_template_str=SUB_QUESTION_PROMPT_TMPL, llm=self.subquestion_llm
         )
 
-        self.sub_question_query_engine = SubQuestionQueryEngine.from_defaults(
+        from llama_index.core.async_utils import run_async_tasks
+        from llama_index.core.base.response.schema import (
+            StreamingResponse as StreamingQueryResponse,
+        )
+        from llama_index.core.callbacks.schema import CBEventType, EventPayload
+        from llama_index.core.utils import get_color_mapping, print_text
+
+        class CustomSubQuestionQueryEngine(SubQuestionQueryEngine):
+            # Decomposition + tool selection already happen in one structured
+            # LLM call (SubQuestionList). When that call produces a single
+            # sub-question, the sub-answer already covers the whole query, so
+            # stream it back directly and skip the final synthesis LLM call.
+            def _query(self, query_bundle):
+                with self.callback_manager.event(
+                    CBEventType.QUERY,
+                    payload={EventPayload.QUERY_STR: query_bundle.query_str},
+                ) as query_event:
+                    sub_questions = self._question_gen.generate(
+                        self._metadatas, query_bundle
+                    )
+
+                    colors = get_color_mapping(
+                        [str(i) for i in range(len(sub_questions))]
+                    )
+
+                    if self._verbose:
+                        print_text(f"Generated {len(sub_questions)} sub questions.\n")
+
+                    if self._use_async:
+                        tasks = [
+                            self._aquery_subq(sub_q, color=colors[str(ind)])
+                            for ind, sub_q in enumerate(sub_questions)
+                        ]
+                        qa_pairs_all = run_async_tasks(tasks)
+                    else:
+                        qa_pairs_all = [
+                            self._query_subq(sub_q, color=colors[str(ind)])
+                            for ind, sub_q in enumerate(sub_questions)
+                        ]
+
+                    # filter out sub questions that failed
+                    qa_pairs = list(filter(None, qa_pairs_all))
+
+                    if len(qa_pairs) == 1:
+                        pair = qa_pairs[0]
+                        response = StreamingQueryResponse(
+                            response_gen=iter([pair.answer]),
+                            source_nodes=pair.sources,
+                        )
+                    else:
+                        nodes = [self._construct_node(pair) for pair in qa_pairs]
+
+                        source_nodes = [
+                            node for qa_pair in qa_pairs for node in qa_pair.sources
+                        ]
+                        # Sub-question count doubles as a complexity
+                        # classifier: standard queries synthesize on the
+                        # fast Groq model, bigger fan-outs keep gpt-4-turbo.
+                        synthesizer = (
+                            fast_response_synthesizer
+                            if len(qa_pairs) <= 2
+                            else self._response_synthesizer
+                        )
+                        response = synthesizer.synthesize(
+                            query=query_bundle,
+                            nodes=nodes,
+                            additional_source_nodes=source_nodes,
+                        )
+
+                    query_event.on_end(payload={EventPayload.RESPONSE: response})
+
+                return response
+
+        self.sub_question_query_engine = CustomSubQuestionQueryEngine.from_defaults(
             query_engine_tools=[
                 mood_feeling_tool,
                 diet_nutrition_tool,
@@ -486,6 +820,9 @@ class Model:
             ],
             response_synthesizer=response_synthesizer,
             question_gen=question_gen,
+            # fan the sub-question queries out concurrently so the Pinecone
+            # round-trips overlap instead of running back to back
+            use_async=True,
         )
 
         self.custom_prompt_forward_history = PromptTemplate(
@@ -502,13 +839,7 @@ class Model:
         )
 
 
-        self.chat_history = [
-            ChatMessage(role=MessageRole.SYSTEM, content=self.SYSTEM_PROMPT),
-            ChatMessage(
-                role=MessageRole.USER,
-                content=self.content_template,
-            ),
-        ]
+        self.chat_history = list(self.static_chat_history)
 
         class CustomCondenseQuestionChatEngine(CondenseQuestionChatEngine):
             def _condense_question(
@@ -533,7 +864,120 @@ class Model:
             verbose=True,
         )
 
-    def _inference(self, prompt: str, messages):
+        self.semantic_cache = SemanticCache(embed_model=self.embed_model)
+
+        # Weather rarely changes between requests - cache it per city with a
+        # TTL. External API calls go through one pooled async client so they
+        # reuse keep-alive/HTTP2 connections and don't block a worker thread.
+        import httpx
+
+        self._weather_cache = {}
+        self._aclient = httpx.AsyncClient(
+            http2=True,
+            timeout=5,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        )
+
+        # Dashboard responses only depend on the menstrual phase, so warm
+        # them for every phase in the background (enter returns immediately)
+        # and let the endpoint serve a dict lookup. Entries are stamped with
+        # the date they were computed so they roll over daily.
+        self._dashboard_cache = {}
+
+        def warm_dashboard_cache():
+            for phase in ["Menstrual", "Follicular", "Ovulation", "Luteal"]:
+                try:
+                    self._dashboard_cache[phase] = (
+                        self.current_date,
+                        self._compute_dashboard_details(phase),
+                    )
+                except Exception as e:
+                    print("Failed to warm dashboard cache for phase", phase, e)
+
+        threading.Thread(target=warm_dashboard_cache, daemon=True).start()
+
+        # Route trigger words are matched in one compiled scan of the prompt
+        # instead of one substring pass per trigger; add new triggers here.
+        self._route_re = re.compile(r"@internet|schedule")
+
+    @property
+    def current_date(self):
+        return date.today()
+
+    @property
+    def day_name(self):
+        return date.today().strftime("%A")
+
+    @property
+    def content_template(self):
+        self._refresh_date_context()
+        return self._cached_content
+
+    @property
+    def static_chat_history(self):
+        self._refresh_date_context()
+        return self._static_chat_history
+
+    def _refresh_date_context(self):
+        """Rebuild the date-dependent context block when the day rolls over.
+
+        The static prefix messages are rebuilt together with it and are
+        otherwise byte-identical across requests (all per-request data goes
+        into later user messages), which keeps the provider-side
+        prompt-prefix cache valid within a day.
+        """
+        from llama_index.core.llms import ChatMessage, MessageRole
+
+        today = date.today()
+        if self._cached_date == today:
+            return
+        self._cached_date = today
+        self._cached_content = f"\nImportant information to be considered while answering the query:\nCurrent Mensural Phase: {self._latest_biometrics['menstrual_phase']} \nToday's date: {today} \nDay of the week: {self.day_name} \n Current Location: New York City"
+        self._static_chat_history = [
+            self._system_message,
+            ChatMessage(
+                role=MessageRole.USER,
+                content=self._cached_content,
+            ),
+        ]
+
+    async def _stream_blocking_gen(self, gen):
+        """Drain a blocking token generator on a background thread.
+
+        The LLM clients expose synchronous generators; iterating them inside
+        an async endpoint would pin the event loop (and running an async
+        generator through run_in_executor is not possible), so a thread pumps
+        tokens into an asyncio.Queue that the endpoint awaits on.
+        """
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        done = object()
+
+        def pump():
+            try:
+                for token in gen:
+                    loop.call_soon_threadsafe(queue.put_nowait, token)
+            except Exception as exc:
+                # hand the failure to the consumer so the stream doesn't
+                # end looking like a clean completion
+                loop.call_soon_threadsafe(queue.put_nowait, exc)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        threading.Thread(target=pump, daemon=True).start()
+        while (token := await queue.get()) is not done:
+            if isinstance(token, Exception):
+                raise token
+            yield token
+
+    async def _inference(self, prompt: str, messages, cache_key=None, cache_embedding=None):
+        sync_gen = self._inference_sync(
+            prompt, messages, cache_key=cache_key, cache_embedding=cache_embedding
+        )
+        async for token in self._stream_blocking_gen(sync_gen):
+            yield token
+
+    def _inference_sync(self, prompt: str, messages, cache_key=None, cache_embedding=None):
         print("Prompt: ", prompt)
         if len(messages) == 0:
             prompt = prompt + "\n" + self.phase_info
@@ -560,13 +1004,7 @@ class Model:
         print("incoming messages", messages)  # role and content
         if len(messages) > 0:
             self.chat_engine.reset()
-            curr_history = [
-                ChatMessage(role=MessageRole.SYSTEM, content=self.SYSTEM_PROMPT),
-                ChatMessage(
-                    role=MessageRole.USER,
-                    content=self.content_template,
-                ),
-            ]
+            curr_history = list(self.static_chat_history)
             for message in messages:
                 role = message["role"]
                 content = message["content"]
@@ -580,13 +1018,7 @@ class Model:
             )
         streaming_response = self.chat_engine.stream_chat(prompt)
         self.chat_engine.reset()
-        self.chat_history = [
-            ChatMessage(role=MessageRole.SYSTEM, content=self.SYSTEM_PROMPT),
-            ChatMessage(
-                role=MessageRole.USER,
-                content=self.content_template,
-            ),
-        ]
+        self.chat_history = list(self.static_chat_history)
         self.chat_engine = CustomCondenseQuestionChatEngine.from_defaults(
             query_engine=self.sub_question_query_engine,
             condense_question_prompt=self.custom_prompt_forward_history,
@@ -594,21 +1026,28 @@ class Model:
             verbose=True,
         )
 
+        generated_tokens = []
         for token in streaming_response.response_gen:
+            if cache_key is not None:
+                generated_tokens.append(token)
+            yield token
+
+        if cache_key is not None:
+            self.semantic_cache.put(cache_key, cache_embedding, generated_tokens)
+
+    async def _online_inference(self, prompt: str, messages):
+        async for token in self._stream_blocking_gen(
+            self._online_inference_sync(prompt, messages)
+        ):
             yield token
 
-    def _online_inference(self, prompt: str, messages):
+    def _online_inference_sync(self, prompt: str, messages):
         print("Prompt: ", prompt)
         prompt = prompt.replace("@internet", "")
         from llama_index.core.llms import ChatMessage, MessageRole
 
         # TODO change current location
-        curr_history = [
-            ChatMessage(
-                role=MessageRole.SYSTEM,
-                content=self.SYSTEM_PROMPT 
-            )
-        ]
+        curr_history = [self._system_message]
         for message in messages:
             role = message["role"]
             content = message["content"]
@@ -653,61 +1092,82 @@ class Model:
             yield token
 
     @web_endpoint(method="POST")
-    def web_inference(self, request: Request, item: Dict):
-        import io, base64
+    async def web_inference(self, request: Request, item: Dict):
         from PIL import Image
         from llama_index.readers.file.image import ImageReader
         from llama_index.multi_modal_llms.openai import OpenAIMultiModal
-        import uuid
         from llama_index.multi_modal_llms.azure_openai import AzureOpenAIMultiModal
-        import os
         
-        prompt, image_url, image_response = "", "", ""
-        if (isinstance(item['prompt'], list)):
-            for value in item['prompt']:
-                if value['type'] == 'text':
-                    prompt = value['text']
-                if value['type'] == 'image_url':
-                    image_url = value['image_url']['url']   
-        else: 
-            prompt = item["prompt"]
-            
-            
-        messages = item["messages"]        
+        # Single pass over the prompt parts; the last part of each type wins,
+        # same as the old per-type loop.
+        if isinstance(item["prompt"], list):
+            parts = {value["type"]: value for value in item["prompt"]}
+        else:
+            parts = {"text": {"text": item["prompt"]}}
+
+        prompt = parts.get("text", {}).get("text", "")
+        image_url = parts.get("image_url", {}).get("image_url", {}).get("url", "")
+        image_response = ""
+
+
+        messages = item["messages"]
+
+        # Trivial prompts skip retrieval + all three LLM calls and answer
+        # from a canned template.
+        if not image_url and len(prompt.split()) < 4 and _TRIVIAL_RE.match(
+            prompt.strip().lower()
+        ):
+            return StreamingResponse(
+                iter([_TRIVIAL_RESPONSE]),
+                media_type="text/event-stream",
+            )
+
+        image_task = None
         if(image_url):
-            print('IMAGE_URL', image_url[:100])
-            id = str(uuid.uuid4())
-            extension = image_url.split(',')[0].split('/')[1].split(';')[0]
-            img = Image.open(io.BytesIO(base64.decodebytes(bytes(image_url.split(',')[1], "utf-8"))))
-            img.save(f"/volumes/moonsync/data/img-{id}.{extension}")
-            
-            image_doc = ImageReader().load_data(file=f"/volumes/moonsync/data/img-{id}.{extension}")
-            print('Image Doc', image_doc)
-                        
-            api_key = os.environ["AZURE_MULTI_MODAL_API_KEY"]
-            azure_endpoint = os.environ["AZURE_MULTI_MODAL_ENDPOINT"]
-
-            # azure_openai_mm_llm = AzureOpenAIMultiModal(
-            #     model="gpt-4-vision-preview",
-            #     deployment_name="moonsync-vision",
-            #     api_key=api_key,
-            #     azure_endpoint=azure_endpoint,
-            #     api_version="2023-10-01-preview",
-            #     max_new_tokens=300,
-            # )
-            
-            # image_response = azure_openai_mm_llm.complete(
-            #     prompt="Describe the images as an alternative text. Give me a title and a description for the image.",
-            #     image_documents=image_doc,
-            # )
-            openai_mm_llm = OpenAIMultiModal(model="gpt-4-vision-preview", max_new_tokens=300)
-
-            image_response = openai_mm_llm.complete(
-                prompt="Describe the images as an alternative text. Give me a title and a detailed description for the image.",
-                image_documents=image_doc,
+            def caption_image():
+                print('IMAGE_URL', image_url[:100])
+                id = str(uuid.uuid4())
+                extension = image_url.split(',')[0].split('/')[1].split(';')[0]
+                img = Image.open(io.BytesIO(base64.decodebytes(bytes(image_url.split(',')[1], "utf-8"))))
+                img.save(f"/volumes/moonsync/data/img-{id}.{extension}")
+
+                image_doc = ImageReader().load_data(file=f"/volumes/moonsync/data/img-{id}.{extension}")
+                print('Image Doc', image_doc)
+
+                api_key = os.environ["AZURE_MULTI_MODAL_API_KEY"]
+                azure_endpoint = os.environ["AZURE_MULTI_MODAL_ENDPOINT"]
+
+                # azure_openai_mm_llm = AzureOpenAIMultiModal(
+                #     model="gpt-4-vision-preview",
+                #     deployment_name="moonsync-vision",
+                #     api_key=api_key,
+                #     azure_endpoint=azure_endpoint,
+                #     api_version="2023-10-01-preview",
+                #     max_new_tokens=300,
+                # )
+
+                # image_response = azure_openai_mm_llm.complete(
+                #     prompt="Describe the images as an alternative text. Give me a title and a description for the image.",
+                #     image_documents=image_doc,
+                # )
+                openai_mm_llm = OpenAIMultiModal(model="gpt-4-vision-preview", max_new_tokens=300)
+
+                caption = openai_mm_llm.complete(
+                    prompt="Describe the images as an alternative text. Give me a title and a detailed description for the image.",
+                    image_documents=image_doc,
+                )
+
+                print("Image description", caption)
+                return caption
+
+            # Submit captioning to the thread pool immediately
+            # (run_in_executor starts it now; create_task(to_thread(...))
+            # wouldn't run before the await) and await it only where the
+            # prompt needs it - @internet/schedule turns return without
+            # ever paying caption latency.
+            image_task = asyncio.get_running_loop().run_in_executor(
+                None, caption_image
             )
-            
-            print("Image description", image_response)
 
         # Get the headers
         city = request.headers.get("x-vercel-ip-city", "NYC")
@@ -716,32 +1176,59 @@ class Model:
 
         print(f"City: {city}, Region: {region}, Country: {country}")
 
-        if "@internet" in prompt:
+        route_hits = set(self._route_re.findall(prompt))
+
+        if "@internet" in route_hits:
             return StreamingResponse(
                 self._online_inference(prompt=prompt, messages=messages),
                 media_type="text/event-stream",
             )
 
-        if "schedule" in prompt:
+        if "schedule" in route_hits:
             return StreamingResponse(
                 self._event_schedule_runner(prompt=prompt, messages=messages),
                 media_type="text/event-stream",
             )
 
+        if image_task is not None:
+            image_response = await image_task
+
+        # The caption has to ride on the prompt itself: sub-question
+        # decomposition only sees the <Follow Up Message> block, so a caption
+        # tucked into the chat history would be invisible to it. The prompt
+        # is already the suffix after the static prefix messages, so this
+        # doesn't disturb provider-side prefix caching.
         if image_response != "":
             prompt = prompt + "\n" + "Additional information about the image uploaded \n " +  image_response.text
-        
+
+        # Cache only fresh, text-only turns - answers to follow up messages
+        # depend on the chat history and are not reusable across sessions.
+        cache_key, cache_embedding = None, None
+        if len(messages) == 0 and image_response == "":
+            phase = self._latest_biometrics["menstrual_phase"]
+            self.semantic_cache.set_context(phase, self.current_date)
+            cache_key = SemanticCache.make_key(prompt, phase, self.current_date)
+            cached_tokens = self.semantic_cache.get_exact(cache_key)
+            if cached_tokens is None:
+                cache_embedding = self.semantic_cache.embed(prompt)
+                cached_tokens = self.semantic_cache.get_similar(cache_embedding)
+            if cached_tokens is not None:
+                return StreamingResponse(
+                    self.semantic_cache.stream(cached_tokens),
+                    media_type="text/event-stream",
+                )
+
         return StreamingResponse(
-            self._inference(prompt=prompt, messages=messages),
+            self._inference(
+                prompt=prompt,
+                messages=messages,
+                cache_key=cache_key,
+                cache_embedding=cache_embedding,
+            ),
             media_type="text/event-stream",
         )
 
-    @web_endpoint(method="POST", label="dashboard")
-    def dashboard_details(self):
-        # prompt = item['test']
-
-        # TODO read phase from dataframe
-        phase = self.df.iloc[-1]["menstrual_phase"]
+    def _compute_dashboard_details(self, phase):
         age = 35
         mood_filler = "on how the user might be feeling today. one point should suggest a way to improve mood"
         nutrition_filler = "on what the user needs to eat. one point should suggest an interesting recipe."
@@ -772,16 +1259,33 @@ class Model:
         }
         return response_json
 
-    def _get_weather(self):
-        import requests
-        import os
+    @web_endpoint(method="POST", label="dashboard")
+    def dashboard_details(self):
+        # prompt = item['test']
+
+        phase = self._latest_biometrics["menstrual_phase"]
+        cached = self._dashboard_cache.get(phase)
+        if cached is not None and cached[0] == self.current_date:
+            return cached[1]
+
+        response_json = self._compute_dashboard_details(phase)
+        self._dashboard_cache[phase] = (self.current_date, response_json)
+        return response_json
+
+    async def _get_weather(self, city="New York City"):
+        now = time.time()
+        cached = self._weather_cache.get(city)
+        if cached is not None and now - cached[0] < WEATHER_CACHE_TTL_SECONDS:
+            return cached[1]
 
         api_key = os.environ["WEATHER_API_KEY"]
         base_url = WEATHER_API_URL
 
-        params = {"key": api_key, "q": "New York City", "aqi": "no"}
+        params = {"key": api_key, "q": city, "aqi": "no"}
 
-        response = requests.get(base_url, params=params)
+        response = await self._aclient.get(
+            base_url, params=params, timeout=WEATHER_API_TIMEOUT_SECONDS
+        )
 
         if response.status_code == 200:
             data = response.json()
@@ -795,22 +1299,24 @@ class Model:
         else:
             print("Error fetching weather data")
 
-        return {"location": location, "condition": condition, "temp_f": temp_f}
+        weather_data = {"location": location, "condition": condition, "temp_f": temp_f}
+        self._weather_cache[city] = (now, weather_data)
+        return weather_data
 
     @web_endpoint(method="POST", label="biometrics")
-    def biometrics_details(self):
+    async def biometrics_details(self):
         # TODO read user id from body
 
-        menstrual_phase = self.df.iloc[-1]["menstrual_phase"]
-        sleep = self.df.iloc[-1]["duration_in_bed"]
-        temperature = 98.6 + self.df.iloc[-1]["temperature_delta"]
+        menstrual_phase = self._latest_biometrics["menstrual_phase"]
+        sleep = self._latest_biometrics["duration_in_bed"]
+        temperature = 98.6 + self._latest_biometrics["temperature_delta"]
 
         m, s = divmod(sleep, 60)
         hours, mins = divmod(m, 60)
 
         sleep = f"{hours} hours {mins} mins"
 
-        weather_data = self._get_weather()
+        weather_data = await self._get_weather()
 
         response_json = {
             "menstrual_phase": menstrual_phase,
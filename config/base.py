@@ -10,3 +10,12 @@ PPLX_MODEL = "llama-3-sonar-large-32k-online"
 PPLX_MODEL_TEMPERATURE = 0.1
 
 WEATHER_API_URL = "http://api.weatherapi.com/v1/current.json"
+WEATHER_CACHE_TTL_SECONDS = 600
+WEATHER_API_TIMEOUT_SECONDS = 2
+
+# fraction of requests traced to langfuse
+TRACE_SAMPLE_RATE = 0.05
+
+# semantic prompt cache
+SEMANTIC_CACHE_MAX_SIZE = 256
+SEMANTIC_CACHE_SIMILARITY_THRESHOLD = 0.95
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# One-shot migration: copy the four per-topic Pinecone indexes into the
+# combined `moonsync-index` under one namespace per topic, so the app can
+# query a single index (one HTTPS connection) instead of four.
+#
+# `moonsync-index` must already exist with the same dimension (1536,
+# text-embedding-ada-002) and metric as the source indexes - create it in
+# the Pinecone console or with pc.create_index before running this.
+# Run once with PINECONE_API_KEY set, then deploy the app.
+
+import os
+
+from pinecone import Pinecone
+
+INDEX_TO_NAMESPACE = {
+    "moonsync-index-mood-feeling": "mood-feeling",
+    "moonsync-index-general": "general",
+    "moonsync-index-diet-nutrition": "diet-nutrition",
+    "moonsync-index-fitness-wellness": "fitness-wellness",
+}
+
+UPSERT_BATCH_SIZE = 100
+
+pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+
+index_names = [index.name for index in pc.list_indexes()]
+assert "moonsync-index" in index_names, (
+    "moonsync-index does not exist - create it with dimension 1536 and the "
+    "same metric as the source indexes before migrating"
+)
+combined_index = pc.Index("moonsync-index")
+
+for index_name, namespace in INDEX_TO_NAMESPACE.items():
+    index = pc.Index(index_name)
+    total = index.describe_index_stats()["total_vector_count"]
+    print(index_name, "->", namespace, ":", total, "vectors")
+
+    # Enumerate ids with the supported pagination and fetch the records by
+    # id - a zero-vector top_k query is capped at 10k, isn't exhaustive
+    # (ANN), and is rejected outright on cosine indexes.
+    upserted = 0
+    for id_batch in index.list():
+        vectors = [
+            {
+                "id": vec_id,
+                "values": vec["values"],
+                "metadata": vec.get("metadata"),
+            }
+            for vec_id, vec in index.fetch(ids=list(id_batch))["vectors"].items()
+        ]
+        for i in range(0, len(vectors), UPSERT_BATCH_SIZE):
+            combined_index.upsert(
+                vectors=vectors[i : i + UPSERT_BATCH_SIZE], namespace=namespace
+            )
+        upserted += len(vectors)
+
+    assert upserted == total, (
+        f"{index_name}: exported {upserted} of {total} vectors - "
+        f"namespace {namespace} is incomplete, do not cut over"
+    )
+    print("upserted", upserted, "vectors into namespace", namespace)
+
+print(combined_index.describe_index_stats())